@@ -10,7 +10,10 @@ ETL процес для обробки даних книг з PostgreSQL:
 - logging замість print()
 - retry з backoff (tenacity) для підключення та запису (тільки transient помилки)
 - chunked processing (ETL_CHUNKSIZE) — обробка частинами, щоб не вантажити все в RAM
-- idempotent load: перед вставкою видаляємо записи books_processed для book_id, що обробляються (анти-дублікат)
+- конвеєр: extract / transform / load чанків паралельно (потоки + обмежені черги)
+- ETL_WORKERS > 1: transform + load чанків у кількох процесах
+- ETL_PROCESS_IN_PYTHON=0: transform виконується прямо в PostgreSQL (INSERT ... SELECT), без pandas
+- idempotent load: INSERT ... ON CONFLICT (book_id) DO UPDATE (upsert, анти-дублікат), у PostgreSQL — один statement на чанк через unnest
 - рекомендований підхід: pandas читає/пише через SQLAlchemy Connection, а не Engine
 
 Запуск:
@@ -21,26 +24,37 @@ ENV:
   DB_SSLMODE (default=require)  # важливо для Neon
   DB_CHANNEL_BINDING (optional) # інколи потрібне для pooled-host в Neon
   ETL_CHUNKSIZE (default=5000)
+  ETL_WORKERS (default=1)       # >1 -> паралельні процеси для transform + load
+  ETL_PROCESS_IN_PYTHON (default=1) # 0 -> весь ETL одним INSERT ... SELECT у базі
   LOG_LEVEL (default=INFO)
   ENV_FILE (optional)           # наприклад ENV_FILE=.env.neon
 
 Залежності:
-  pip install pandas sqlalchemy psycopg2-binary python-decouple tenacity
+  pip install pandas numpy pyarrow sqlalchemy "psycopg[binary]" python-decouple tenacity
 """
 
 from __future__ import annotations
 
+import atexit
 import logging
+import multiprocessing
 import os
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import closing
 from datetime import datetime
 from pathlib import Path
-from typing import Iterator, Optional
+from typing import Any, Callable, Iterator, Optional
 
+import numpy as np
 import pandas as pd
 from decouple import AutoConfig, Config, RepositoryEnv
-from sqlalchemy import bindparam, create_engine, text
+from psycopg.types.numeric import FloatLoader
+from sqlalchemy import Column, DateTime, Integer, MetaData, Numeric, String, Table, create_engine, event, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine import Connection, Engine, URL
 from sqlalchemy.exc import InterfaceError, OperationalError, SQLAlchemyError
 from tenacity import before_sleep_log, retry, retry_if_exception_type, stop_after_attempt, wait_exponential
@@ -101,15 +115,32 @@ def _required_env(host: str, name: str, user: str, password: str) -> None:
 # ----------------------------
 # DB connect (retry only transient)
 # ----------------------------
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=1, max=20),
-    # Retry тільки transient помилки мережі/каналу.
-    retry=retry_if_exception_type((OperationalError, InterfaceError)),
-    before_sleep=before_sleep_log(logger, logging.WARNING),
-    reraise=True,
-)
-def connect_to_db() -> Engine:
+def _register_numeric_as_float(dbapi_conn: Any, _record: Any) -> None:
+    """SQLAlchemy "connect" hook: NUMERIC -> float одразу в psycopg, без Decimal-обʼєкта на кожне значення.
+
+    Loader реєструється лише для зʼєднань цього Engine, pandas отримує float64.
+    """
+    dbapi_conn.adapters.register_loader("numeric", FloatLoader)
+
+
+def _db_retry(attempts: int) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Спільна retry-політика для БД: exponential backoff, retry тільки transient помилки мережі/каналу."""
+    return retry(
+        stop=stop_after_attempt(attempts),
+        wait=wait_exponential(multiplier=1, min=1, max=20),
+        retry=retry_if_exception_type((OperationalError, InterfaceError)),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True,
+    )
+
+
+def _db_write_retry() -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Retry-політика для запису: кількість спроб з DB_WRITE_ATTEMPTS (читається на кожен виклик)."""
+    return _db_retry(int(CFG("DB_WRITE_ATTEMPTS", default="3")))
+
+
+@_db_retry(3)
+def connect_to_db(*, pool_size: int = 5) -> Engine:
     """Створює SQLAlchemy Engine і перевіряє з'єднання (SELECT 1)."""
     host = CFG("DB_HOST", default="localhost")
     port = CFG("DB_PORT", default="5432")
@@ -126,7 +157,9 @@ def connect_to_db() -> Engine:
         query["channel_binding"] = channel_binding
 
     url = URL.create(
-        "postgresql+psycopg2",
+        # psycopg 3: server-side binding параметрів і автоматичні prepared statements
+        # для запитів, що повторюються (upsert чанку має сталий текст SQL).
+        "postgresql+psycopg",
         username=user,
         password=password,
         host=host,
@@ -135,7 +168,12 @@ def connect_to_db() -> Engine:
         query=query,
     )
 
-    engine = create_engine(url, pool_pre_ping=True)
+    engine = create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+    )
+    event.listen(engine, "connect", _register_numeric_as_float)
 
     # Пробне підключення (ловить неправильний пароль / SSL одразу).
     with engine.connect() as conn:
@@ -148,20 +186,43 @@ def connect_to_db() -> Engine:
 # ----------------------------
 # Extract
 # ----------------------------
+# Явні dtypes для всіх колонок extract, щоб pandas не виводив їх з даних для кожного чанку:
+# - price приходить як float (див. _register_numeric_as_float); float64 гарантує numpy-буфер для transform;
+# - рядки зберігаємо в Arrow-буферах (string[pyarrow]) замість object-масиву Python str;
+# - book_id — фіксований numpy int64.
+_EXTRACT_DTYPES = {
+    "book_id": "int64",
+    "title": "string[pyarrow]",
+    "price": "float64",
+    "genre": "string[pyarrow]",
+}
+
+# Один скомпільований на рівні модуля SELECT для обох режимів extract.
+# Вибираємо лише колонки, які потрапляють у books_processed: stock_quantity і last_updated
+# ETL не пише, тож не тягнемо їх через мережу, драйвер і pandas.
+# Порядок лише за book_id (PRIMARY KEY): для стабільних чанків цього досить, а PK-індекс
+# віддає рядки вже відсортованими, без Sort (і без spill на диск для великих вибірок).
+_EXTRACT_SQL = text("""
+    SELECT book_id, title, price, genre
+    FROM books
+    WHERE last_updated >= :cutoff
+    ORDER BY book_id ASC
+""")
+
+
 def extract_books_iter(engine: Engine, cutoff_dt: datetime, *, chunksize: int) -> Iterator[pd.DataFrame]:
-    """Читає books чанками, тримаючи Connection відкритим на час ітерації."""
-    sql = """
-        SELECT book_id, title, price, genre, stock_quantity, last_updated
-        FROM books
-        WHERE last_updated >= %(cutoff)s
-        ORDER BY last_updated ASC, book_id ASC
-    """
+    """Читає books чанками через server-side cursor, тримаючи Connection відкритим на час ітерації.
 
-    conn = engine.connect()
+    pd.read_sql_query(chunksize=...) з psycopg спершу тягне весь результат у клієнт,
+    а yield_per вмикає іменований курсор: з сервера читається лише chunksize рядків за раз.
+    """
+    conn = engine.connect().execution_options(yield_per=chunksize)
     try:
-        for chunk in pd.read_sql_query(sql, conn, params={"cutoff": cutoff_dt}, chunksize=chunksize):
-            yield chunk
-    except Exception as e: 
+        result = conn.execute(_EXTRACT_SQL, {"cutoff": cutoff_dt})
+        columns = list(result.keys())
+        for rows in result.partitions(chunksize):
+            yield pd.DataFrame.from_records(rows, columns=columns).astype(_EXTRACT_DTYPES)
+    except Exception as e:
         raise RuntimeError(f"Помилка зчитування даних з таблиці books: {e}") from e
     finally:
         conn.close()
@@ -169,15 +230,9 @@ def extract_books_iter(engine: Engine, cutoff_dt: datetime, *, chunksize: int) -
 
 def extract_books(engine: Engine, cutoff_dt: datetime) -> pd.DataFrame:
     """Читає всі дані одним DataFrame (fallback, якщо chunksize <= 0)."""
-    sql = """
-        SELECT book_id, title, price, genre, stock_quantity, last_updated
-        FROM books
-        WHERE last_updated >= %(cutoff)s
-        ORDER BY last_updated ASC, book_id ASC
-    """
     try:
         with engine.connect() as conn:
-            return pd.read_sql_query(sql, conn, params={"cutoff": cutoff_dt})
+            return pd.read_sql_query(_EXTRACT_SQL, conn, params={"cutoff": cutoff_dt}, dtype=_EXTRACT_DTYPES)
     except Exception as e:
         raise RuntimeError(f"Помилка зчитування даних з таблиці books: {e}") from e
 
@@ -186,67 +241,141 @@ def extract_books(engine: Engine, cutoff_dt: datetime) -> pd.DataFrame:
 # Transform
 # ----------------------------
 def transform_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Перетворення даних згідно бізнес-правил з ТЗ."""
-    if df.empty:
-        return df
+    """Перетворення даних згідно бізнес-правил з ТЗ.
 
-    out = df.copy()
-    out["original_price"] = out["price"]
-    out["rounded_price"] = out["price"].round(1)
-    out["price_category"] = out["rounded_price"].apply(lambda x: "budget" if x < 500 else "premium")
-    out = out.drop(columns=["price"])
-    return out
+    Повертає новий DataFrame рівно з колонками books_processed у порядку вставки
+    (book_id, title, original_price, rounded_price, genre, price_category), тож load
+    не робить per-chunk reindex (зокрема й для порожнього чанку). Вхідний df не змінюється.
+    """
+    # Один float64-буфер для всіх похідних колонок (без копії, якщо price уже float64).
+    prices = df["price"].to_numpy(dtype=np.float64, copy=False)
+    rounded = np.round(prices, 1)
+
+    return pd.DataFrame(
+        {
+            "book_id": df["book_id"],
+            "title": df["title"],
+            "original_price": prices,
+            "rounded_price": rounded,
+            "genre": df["genre"],
+            # Векторизована умова замість .apply(lambda) по кожному рядку.
+            "price_category": np.where(rounded < 500, "budget", "premium"),
+        },
+        index=df.index,
+        copy=False,
+    )
 
 
 # ----------------------------
 # Load (idempotent + retry only transient)
 # ----------------------------
-def _delete_existing_processed(conn: Connection, book_ids: list[int]) -> None:
-    """Видаляє існуючі записи з books_processed для конкретних book_id (анти-дублікат)."""
-    delete_stmt = text("DELETE FROM books_processed WHERE book_id IN :ids").bindparams(
-        bindparam("ids", expanding=True)
+# Опис books_processed для Core upsert (лише колонки, які пише ETL, + processed_at).
+_BOOKS_PROCESSED = Table(
+    "books_processed",
+    MetaData(),
+    Column("book_id", Integer, nullable=False),
+    Column("title", String(500), nullable=False),
+    Column("original_price", Numeric(10, 2, asdecimal=False), nullable=False),
+    Column("rounded_price", Numeric(10, 1, asdecimal=False), nullable=False),
+    Column("genre", String(100)),
+    Column("price_category", String(10), nullable=False),
+    Column("processed_at", DateTime(timezone=True)),
+)
+
+
+def _build_upsert(insert: Callable[[Table], Any]) -> Any:
+    """Будує INSERT ... ON CONFLICT (book_id) DO UPDATE для books_processed у заданому діалекті."""
+    stmt = insert(_BOOKS_PROCESSED)
+    update_cols = {
+        c.name: stmt.excluded[c.name]
+        for c in _BOOKS_PROCESSED.columns
+        if c.name not in ("book_id", "processed_at")
+    }
+    return stmt.on_conflict_do_update(
+        index_elements=["book_id"],
+        set_={**update_cols, "processed_at": func.now()},
     )
-    conn.execute(delete_stmt, {"ids": book_ids})
-
-
-def _insert_processed(conn: Connection, df: pd.DataFrame) -> None:
-    """Вставляє дані в books_processed через pandas.to_sql()."""
-    df.to_sql(
-        "books_processed",
-        conn,  # Важливо: Connection, не Engine
-        if_exists="append",
-        index=False,
-        chunksize=1000,
-        method="multi",
+
+
+# Upsert для інших діалектів (SQLite у тестах) будується один раз, а не на кожен чанк.
+_UPSERT_PROCESSED_STMTS = {
+    "sqlite": _build_upsert(sqlite_insert),
+}
+
+# PostgreSQL: колонки передаються масивами через unnest(), тож текст SQL однаковий для будь-якого
+# розміру чанку (один план, один roundtrip), на відміну від multi-row VALUES змінної довжини.
+_PG_ON_CONFLICT_SQL = """
+    ON CONFLICT (book_id) DO UPDATE SET
+        title = EXCLUDED.title,
+        original_price = EXCLUDED.original_price,
+        rounded_price = EXCLUDED.rounded_price,
+        genre = EXCLUDED.genre,
+        price_category = EXCLUDED.price_category,
+        processed_at = now()
+"""
+
+_UPSERT_PROCESSED_PG_SQL = text(f"""
+    INSERT INTO books_processed (book_id, title, original_price, rounded_price, genre, price_category)
+    SELECT * FROM unnest(
+        CAST(:book_id AS integer[]),
+        CAST(:title AS varchar[]),
+        CAST(:original_price AS numeric[]),
+        CAST(:rounded_price AS numeric[]),
+        CAST(:genre AS varchar[]),
+        CAST(:price_category AS varchar[])
     )
+    {_PG_ON_CONFLICT_SQL}
+""")
+
+
+def _check_upsert_dialect(conn: Connection) -> None:
+    """Перевіряє, що для діалекту conn є upsert (ValueError — помилка конфігурації, а не збій запису)."""
+    name = conn.dialect.name
+    if name != "postgresql" and name not in _UPSERT_PROCESSED_STMTS:
+        raise ValueError(f"Upsert у books_processed не підтримується для діалекту {name}")
+
 
+def _upsert_processed(conn: Connection, df: pd.DataFrame) -> None:
+    """Idempotent запис у books_processed одним INSERT ... ON CONFLICT (book_id) DO UPDATE.
 
-def load_data(df: pd.DataFrame, engine: Engine) -> int:
-    """Idempotent load у межах транзакції + retry на transient помилки."""
+    Потребує унікального індексу на books_processed(book_id) (див. books_schema.sql).
+    У PostgreSQL весь чанк іде одним statement з масивами-колонками; в інших діалектах
+    SQLAlchemy розбиває executemany на multi-row VALUES пакети (insertmanyvalues).
+    """
+    if conn.dialect.name == "postgresql":
+        # to_numpy(dtype=object) дає Python-скаляри, а NA -> None (psycopg не адаптує pd.NA).
+        params = {c: df[c].to_numpy(dtype=object, na_value=None).tolist() for c in df.columns}
+        conn.execute(_UPSERT_PROCESSED_PG_SQL, params)
+        return
+
+    conn.execute(_UPSERT_PROCESSED_STMTS[conn.dialect.name], df.to_dict("records"))
+
+
+def load_data(df: pd.DataFrame, conn: Connection) -> int:
+    """Idempotent load результату transform_data на переданому Connection + retry на transient помилки.
+
+    df уже має рівно колонки books_processed, тож вставляється без reindex. Кожен чанк —
+    окрема транзакція. Один довгоживучий Connection на всі чанки замість checkout/checkin з пулу на кожен.
+    Якщо викликач уже відкрив транзакцію на conn, чанк пишеться в SAVEPOINT.
+    """
     if df.empty:
         return 0
 
-    cols = ["book_id", "title", "original_price", "rounded_price", "genre", "price_category"]
-    to_load = df[cols].copy()
-
-    # Унікальні book_id у поточному чанку.
-    book_ids = to_load["book_id"].dropna().astype(int).unique().tolist()
-    if not book_ids:
+    # Чанк без жодного book_id пропускаємо. Upsert сам список id не потребує, тож
+    # достатньо однієї векторної перевірки замість dropna/astype/unique/tolist.
+    if pd.isna(df["book_id"].to_numpy()).all():
         return 0
 
-    @retry(
-        stop=stop_after_attempt(int(CFG("DB_WRITE_ATTEMPTS", default="3"))),
-        wait=wait_exponential(multiplier=1, min=1, max=20),
-        retry=retry_if_exception_type((OperationalError, InterfaceError)),
-        before_sleep=before_sleep_log(logger, logging.WARNING),
-        reraise=True,
-    )
+    # Непідтримуваний діалект — один раз і до retry: повторні спроби тут нічого не змінять.
+    _check_upsert_dialect(conn)
+
+    @_db_write_retry()
     def _do_load() -> int:
-        # engine.begin() -> транзакція (commit/rollback автоматично)
-        with engine.begin() as conn:
-            _delete_existing_processed(conn, book_ids)
-            _insert_processed(conn, to_load)
-        return len(to_load)
+        # commit/rollback автоматично; після обриву звʼязку наступна спроба
+        # перепідключить invalidated Connection сама.
+        with conn.begin_nested() if conn.in_transaction() else conn.begin():
+            _upsert_processed(conn, df)
+        return len(df)
 
     try:
         return _do_load()
@@ -256,6 +385,240 @@ def load_data(df: pd.DataFrame, engine: Engine) -> int:
         raise RuntimeError(f"Неочікувана помилка при завантаженні: {e}") from e
 
 
+# ----------------------------
+# In-database ETL (ETL_PROCESS_IN_PYTHON=0)
+# ----------------------------
+# Ті самі бізнес-правила, що й у transform_data, але одним INSERT ... SELECT на сервері:
+# дані не проходять через мережу і pandas. round(numeric, 1) у PostgreSQL округлює .x5
+# "від нуля", тоді як float-шлях у Python — до парного, тож такі ціни можуть відрізнятись на 0.1.
+_IN_DATABASE_ETL_SQL = text(f"""
+    INSERT INTO books_processed (book_id, title, original_price, rounded_price, genre, price_category)
+    SELECT
+        book_id,
+        title,
+        price,
+        round(price, 1),
+        genre,
+        CASE WHEN round(price, 1) < 500 THEN 'budget' ELSE 'premium' END
+    FROM books
+    WHERE last_updated >= :cutoff
+    {_PG_ON_CONFLICT_SQL}
+""")
+
+
+def run_in_database(engine: Engine, cutoff_dt: datetime) -> int:
+    """Виконує весь ETL на сервері (INSERT ... SELECT ... ON CONFLICT). Повертає кількість записів."""
+
+    @_db_write_retry()
+    def _do_run() -> int:
+        with engine.begin() as conn:
+            return conn.execute(_IN_DATABASE_ETL_SQL, {"cutoff": cutoff_dt}).rowcount
+
+    try:
+        return _do_run()
+    except SQLAlchemyError as e:
+        raise RuntimeError(f"Помилка виконання ETL у базі даних: {e}") from e
+
+
+# ----------------------------
+# Pipeline (extract / transform / load паралельно)
+# ----------------------------
+_PIPELINE_DONE = object()  # sentinel: етап завершив роботу
+
+
+def _queue_put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """Кладе item у чергу; повертає False, якщо інший етап упав (stop), щоб не зависнути на повній черзі."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _queue_get(q: queue.Queue, stop: threading.Event) -> Any:
+    """Бере item з черги; повертає _PIPELINE_DONE, якщо інший етап упав (stop)."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _PIPELINE_DONE
+
+
+def run_chunked_pipeline(engine: Engine, cutoff_dt: datetime, *, chunksize: int) -> tuple[int, int]:
+    """Обробляє чанки конвеєром: extract і load у власних потоках, transform у поточному.
+
+    Extract і load чекають на мережу/БД на різних Connection з пулу, тож перекриваються
+    між собою і з transform. Черги maxsize=2 дають backpressure: у памʼяті одночасно
+    лише кілька чанків. Повертає (extracted_total, loaded_total).
+    """
+    raw_q: queue.Queue = queue.Queue(maxsize=2)
+    load_q: queue.Queue = queue.Queue(maxsize=2)
+    stop = threading.Event()
+
+    def _extract() -> None:
+        try:
+            with closing(extract_books_iter(engine, cutoff_dt, chunksize=chunksize)) as chunks:
+                for chunk in chunks:
+                    if not chunk.empty and not _queue_put(raw_q, chunk, stop):
+                        return
+            _queue_put(raw_q, _PIPELINE_DONE, stop)
+        except BaseException:
+            stop.set()
+            raise
+
+    def _load() -> int:
+        loaded_total = 0
+        try:
+            with engine.connect() as load_conn:
+                while True:
+                    item = _queue_get(load_q, stop)
+                    if item is _PIPELINE_DONE:
+                        return loaded_total
+
+                    idx, extracted, extracted_total, transformed = item
+                    loaded = load_data(transformed, load_conn)
+                    loaded_total += loaded
+
+                    logger.info(
+                        "Chunk %d processed: extracted=%d loaded=%d (totals: extracted=%d loaded=%d)",
+                        idx,
+                        extracted,
+                        loaded,
+                        extracted_total,
+                        loaded_total,
+                    )
+        except BaseException:
+            stop.set()
+            raise
+
+    extracted_total = 0
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="books_etl") as pool:
+        extract_future = pool.submit(_extract)
+        load_future = pool.submit(_load)
+
+        try:
+            idx = 0
+            while True:
+                chunk = _queue_get(raw_q, stop)
+                if chunk is _PIPELINE_DONE:
+                    break
+
+                idx += 1
+                extracted_total += len(chunk)
+                item = (idx, len(chunk), extracted_total, transform_data(chunk))
+                if not _queue_put(load_q, item, stop):
+                    break
+
+            _queue_put(load_q, _PIPELINE_DONE, stop)
+        except BaseException:
+            stop.set()
+            raise
+
+        # result() прокидує помилку етапу, що впав (першою — помилку extract).
+        extract_future.result()
+        loaded_total = load_future.result()
+
+    return extracted_total, loaded_total
+
+
+# ----------------------------
+# Multiprocessing (ETL_WORKERS > 1)
+# ----------------------------
+_WORKER_CONN: Optional[Connection] = None
+
+
+def _close_worker(engine: Engine) -> None:
+    """atexit у воркері: закриває Connection і Engine, щоб сервер не лишався з обірваними сесіями."""
+    global _WORKER_CONN
+    if _WORKER_CONN is not None:
+        _WORKER_CONN.close()
+        _WORKER_CONN = None
+    engine.dispose()
+
+
+def _init_worker() -> None:
+    """Ініціалізує процес-воркер: логування і власний Engine з одним Connection на всі чанки."""
+    global _WORKER_CONN
+    setup_logging()
+    engine = connect_to_db(pool_size=1)
+    _WORKER_CONN = engine.connect()
+    # spawn-воркер завершується звичайним виходом інтерпретатора, тож atexit-обробники виконуються.
+    atexit.register(_close_worker, engine)
+
+
+def _process_chunk(chunk: pd.DataFrame) -> int:
+    """Transform + load одного чанку в процесі-воркері. Повертає кількість збережених записів."""
+    return load_data(transform_data(chunk), _WORKER_CONN)
+
+
+def _cap_workers(engine: Engine, requested: int) -> int:
+    """Обмежує ETL_WORKERS кількістю CPU та половиною max_connections сервера."""
+    with engine.connect() as conn:
+        max_connections = int(conn.execute(text("SHOW max_connections")).scalar())
+    return max(1, min(requested, os.cpu_count() or 1, max_connections // 2))
+
+
+def run_chunked_multiprocess(
+    engine: Engine, cutoff_dt: datetime, *, chunksize: int, workers: int
+) -> tuple[int, int]:
+    """Extract у поточному процесі, transform + load чанків паралельно у `workers` процесах.
+
+    Чанки незалежні (різні book_id, окремі транзакції), тож їх можна писати паралельно.
+    Одночасно в роботі не більше workers * 2 чанків, щоб extract не випереджав load
+    і RAM лишалась обмеженою. Повертає (extracted_total, loaded_total).
+    """
+    extracted_total = 0
+    loaded_total = 0
+    pending: dict[Future, tuple[int, int]] = {}
+
+    def _collect(return_when: str) -> None:
+        nonlocal loaded_total
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            idx, extracted = pending.pop(future)
+            loaded = future.result()
+            loaded_total += loaded
+            logger.info(
+                "Chunk %d processed: extracted=%d loaded=%d (totals: extracted=%d loaded=%d)",
+                idx,
+                extracted,
+                loaded,
+                extracted_total,
+                loaded_total,
+            )
+
+    # spawn: воркери не успадковують зʼєднання пулу батьківського Engine.
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    try:
+        with closing(extract_books_iter(engine, cutoff_dt, chunksize=chunksize)) as chunks:
+            idx = 0
+            for chunk in chunks:
+                if chunk.empty:
+                    continue
+
+                idx += 1
+                extracted_total += len(chunk)
+                pending[pool.submit(_process_chunk, chunk)] = (idx, len(chunk))
+                if len(pending) >= workers * 2:
+                    _collect(FIRST_COMPLETED)
+
+        if pending:
+            _collect(ALL_COMPLETED)
+    except BaseException:
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+
+    return extracted_total, loaded_total
+
+
 # ----------------------------
 # Main
 # ----------------------------
@@ -277,35 +640,37 @@ def main() -> None:
 
         chunksize = int(CFG("ETL_CHUNKSIZE", default="5000"))
         use_chunks = chunksize > 0
+        process_in_python = CFG("ETL_PROCESS_IN_PYTHON", default=True, cast=bool)
 
         extracted_total = 0
         loaded_total = 0
 
-        if use_chunks:
-            logger.info("Extract in chunks: chunksize=%d", chunksize)
-            any_rows = False
+        if not process_in_python:
+            logger.info("ETL_PROCESS_IN_PYTHON=0: виконуємо ETL одним запитом у базі даних")
+            loaded_total = run_in_database(engine, cutoff_dt)
+            extracted_total = loaded_total
 
-            for idx, chunk in enumerate(extract_books_iter(engine, cutoff_dt, chunksize=chunksize), start=1):
-                if chunk.empty:
-                    continue
+            if loaded_total == 0:
+                logger.info("Нових книг для обробки за вказану дату не знайдено. Роботу завершено")
+                sys.exit(0)
 
-                any_rows = True
-                extracted_total += len(chunk)
+            logger.info("Збережено %d записів в books_processed", loaded_total)
+
+        elif use_chunks:
+            workers = int(CFG("ETL_WORKERS", default="1"))
+            if workers > 1:
+                workers = _cap_workers(engine, workers)
 
-                transformed = transform_data(chunk)
-                loaded = load_data(transformed, engine)
-                loaded_total += loaded
-
-                logger.info(
-                    "Chunk %d processed: extracted=%d loaded=%d (totals: extracted=%d loaded=%d)",
-                    idx,
-                    len(chunk),
-                    loaded,
-                    extracted_total,
-                    loaded_total,
+            if workers > 1:
+                logger.info("Extract in chunks: chunksize=%d workers=%d", chunksize, workers)
+                extracted_total, loaded_total = run_chunked_multiprocess(
+                    engine, cutoff_dt, chunksize=chunksize, workers=workers
                 )
+            else:
+                logger.info("Extract in chunks: chunksize=%d", chunksize)
+                extracted_total, loaded_total = run_chunked_pipeline(engine, cutoff_dt, chunksize=chunksize)
 
-            if not any_rows:
+            if extracted_total == 0:
                 logger.info("Витягнуто 0 записів з таблиці books")
                 logger.info("Нових книг для обробки за вказану дату не знайдено. Роботу завершено")
                 sys.exit(0)
@@ -319,7 +684,8 @@ def main() -> None:
                 sys.exit(0)
 
             transformed = transform_data(df)
-            loaded_total = load_data(transformed, engine)
+            with engine.connect() as load_conn:
+                loaded_total = load_data(transformed, load_conn)
             extracted_total = len(df)
             logger.info("Збережено %d записів в books_processed", loaded_total)
 
@@ -58,6 +58,11 @@ CREATE INDEX IF NOT EXISTS idx_books_genre ON books (genre);
 CREATE INDEX IF NOT EXISTS idx_books_last_updated ON books (last_updated);
 CREATE INDEX IF NOT EXISTS idx_books_price_range ON books (price);
 
+-- Унікальний book_id у books_processed потрібен для idempotent upsert у books_etl.py
+-- (INSERT ... ON CONFLICT (book_id) DO UPDATE). Для вже існуючої бази спершу приберіть дублікати
+-- (див. README, розділ "Міграція"), інакше індекс не створиться.
+CREATE UNIQUE INDEX IF NOT EXISTS uq_books_processed_book_id ON books_processed (book_id);
+
 
 -- TODO 4: Додайте тестові дані
 -- Вставте рівно 6 записів книг з наступними вимогами:
@@ -0,0 +1,12 @@
+import pytest
+import pandas as pd
+import sqlalchemy  # noqa: F401
+
+# Важкі модулі імпортуються один раз на сесію pytest — тестові модулі беруть їх уже з sys.modules.
+import books_etl  # noqa: F401
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warm():
+    """Прогріває pandas (створення DataFrame + round) до першого тесту."""
+    pd.DataFrame({"a": [1.0]}).round(1)
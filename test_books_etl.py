@@ -1,150 +1,423 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from datetime import datetime
-from sqlalchemy import create_engine, text
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine, event, func
+from sqlalchemy.pool import StaticPool
 
 # Імпортуємо функції з вашого скрипта
-from books_etl import transform_data, _validate_cli_date, _required_env, load_data
+import books_etl
+from books_etl import transform_data, _validate_cli_date, _required_env, load_data, run_chunked_pipeline
+
+
+# Колонки books_processed у порядку вставки (результат transform_data).
+PROCESSED_COLUMNS = ["book_id", "title", "original_price", "rounded_price", "genre", "price_category"]
+EXPECTED_COLS = frozenset(PROCESSED_COLUMNS)
+
+# Очікуваний результат transform_data(input_df):
+# - округлення до 1 знака: np.round(price, 1) для float 499.95 дає 500.0;
+# - категорії (Budget < 500, Premium >= 500): 500.0 -> premium (оскільки умова x < 500).
+EXPECTED = pd.DataFrame({
+    "book_id": [1, 2, 3],
+    "rounded_price": [100.0, 1000.0, 500.0],
+    "price_category": ["budget", "premium", "premium"],
+})
+
+# Arrow-типи колонок books_processed у тому вигляді, як їх читає read_sql_query(dtype_backend="pyarrow").
+LOADED_ARROW_TYPES = {
+    "book_id": pa.int64(),
+    "title": pa.string(),
+    "original_price": pa.float64(),
+    "rounded_price": pa.float64(),
+    "genre": pa.string(),
+    "price_category": pa.string(),
+}
+
+# Очікувані тексти помилок валідації — компілюємо один раз для pytest.raises(match=...).
+_RE_DATE_ERR = re.compile(r"Невірний формат дати")
+_RE_ENV_ERR = re.compile(r"Не вказана обов'язкова змінна")
+
+# Тестова схема books_processed: book_id — PRIMARY KEY, щоб ON CONFLICT (book_id) мав на що спертися.
+TEST_METADATA = MetaData()
+BOOKS_PROCESSED = Table(
+    "books_processed",
+    TEST_METADATA,
+    Column("book_id", Integer, primary_key=True),
+    Column("title", String),
+    Column("original_price", Float),
+    Column("rounded_price", Float),
+    Column("genre", String),
+    Column("price_category", String),
+    Column("processed_at", DateTime, server_default=func.current_timestamp()),
+)
 
 
 # -------------------------------------------------------------------
 # Fixtures (Дані для тестів)
 # -------------------------------------------------------------------
+@pytest.fixture(scope="session")
+def engine():
+    """SQLite в пам'яті + схема books_processed — створюються один раз на всю сесію.
+
+    StaticPool: одне DBAPI-зʼєднання (а отже одна in-memory база) для всіх Connection,
+    зокрема з потоків конвеєра.
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+    # Рецепт SQLAlchemy для pysqlite: BEGIN видає сам SQLAlchemy, інакше SAVEPOINT
+    # (load_data всередині транзакції тесту) може закомітити дані назавжди.
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_begin(dbapi_conn, _record):
+        dbapi_conn.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    # Схема — один раз, у власній закомітленій транзакції. Seed-рядки сюди не додаємо:
+    # тести свої дані відкочують (див. db_conn / clean_db).
+    TEST_METADATA.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def db_conn(engine):
+    """Connection у транзакції, яка відкочується після тесту — кожен тест бачить порожню таблицю."""
+    conn = engine.connect()
+    trans = conn.begin()
+    yield conn
+    trans.rollback()
+    conn.close()
+
 @pytest.fixture
+def clean_db(db_conn):
+    """books_processed без чужих даних + один "старий" запис (book_id=1) для перевірки upsert.
+
+    DELETE і seed йдуть у транзакції db_conn, тож після тесту відкочуються разом з усім іншим.
+    """
+    db_conn.exec_driver_sql("DELETE FROM books_processed")
+    seed_rows = [{"book_id": 1, "title": "Old Title"}]
+    # Список словників -> executemany / insertmanyvalues діалекту; та сама транзакція db_conn.
+    db_conn.execute(BOOKS_PROCESSED.insert(), seed_rows)
+    yield db_conn
+
+@pytest.fixture(scope="module")
 def input_df():
-    """Створює тестовий DataFrame, що імітує дані з БД."""
+    """Створює тестовий DataFrame, що імітує дані з БД.
+
+    Один на модуль: transform_data і load_data вхідний df не змінюють, тож тести можуть його ділити.
+    """
+    # Типізовані масиви замість списків — pandas не виводить dtypes; book_id/title/price/genre
+    # мають ті самі dtypes, що й чанки з extract (books_etl._EXTRACT_DTYPES).
     data = {
-        "book_id": [1, 2, 3],
-        "title": ["Cheap Book", "Expensive Book", "Borderline Book"],
-        "price": [100.00, 999.99, 499.95],  # 499.95 округлиться до 500.0? Перевіримо.
-        "genre": ["Fiction", "Tech", "History"],
-        "stock_quantity": [10, 5, 2],
-        "last_updated": [datetime(2025, 1, 1), datetime(2025, 1, 1), datetime(2025, 1, 1)],
+        "book_id": np.array([1, 2, 3], dtype=np.int64),
+        "title": pd.array(["Cheap Book", "Expensive Book", "Borderline Book"], dtype="string[pyarrow]"),
+        "price": np.array([100.00, 999.99, 499.95], dtype=np.float64),  # 499.95 округлиться до 500.0? Перевіримо.
+        "genre": pd.array(["Fiction", "Tech", "History"], dtype="string[pyarrow]"),
+        "stock_quantity": np.array([10, 5, 2], dtype=np.int16),
+        "last_updated": pd.to_datetime(["2025-01-01"] * 3, format="%Y-%m-%d"),
     }
     return pd.DataFrame(data)
 
+@pytest.fixture(scope="module")
+def processed_df(input_df):
+    """Результат transform_data(input_df) — рахуємо один раз на модуль (функція чиста).
+
+    Спільний для тестів transform і load: load_data df не змінює.
+    """
+    return transform_data(input_df)
+
 # -------------------------------------------------------------------
 # Tests for Transformation (Бізнес-логіка)
 # -------------------------------------------------------------------
-def test_transform_data_logic(input_df):
+def test_transform_data_logic(processed_df):
     """Перевіряємо, чи правильно рахуються категорії та округлення."""
-    
-    # Виконуємо функцію
-    result = transform_data(input_df)
-
-    # 1. Перевіряємо, чи зникла колонка 'price'
-    assert "price" not in result.columns
-    assert "original_price" in result.columns
-    assert "rounded_price" in result.columns
-
-    # 2. Перевіряємо округлення (499.95 -> 500.0 ?)
-    # Примітка: round(1) працює як банківське округлення або математичне, залежить від версії.
-    # В Pandas .round(1) для 499.95 зазвичай дає 500.0 (float).
-    #expected_rounded = [100.0, 1000.0, 500.0] 
-    
-    assert result.loc[0, "rounded_price"] == 100.0
-    assert result.loc[1, "rounded_price"] == 1000.0
-    
-    # 3. Перевіряємо категорії (Budget < 500, Premium >= 500)
-    # 100.0 -> budget
-    # 1000.0 -> premium
-    # 500.0 -> premium (оскільки умова x < 500)
-    assert result.loc[0, "price_category"] == "budget"
-    assert result.loc[1, "price_category"] == "premium"
-    # Якщо 499.95 округлилось до 500.0, то це Premium
-    assert result.loc[2, "price_category"] == "premium"
-
-def test_transform_data_empty():
-    """Перевіряємо, що пустий вхід дає пустий вихід, а не помилку."""
-    empty_df = pd.DataFrame()
+    pd.testing.assert_frame_equal(processed_df[EXPECTED.columns].reset_index(drop=True), EXPECTED)
+
+def test_transform_data_empty(input_df):
+    """Перевіряємо, що пустий вхід дає пустий вихід зі схемою books_processed, а не помилку.
+
+    Нуль рядків, але та сама схема й dtypes, що й у input_df — як порожній чанк з extract;
+    transform проходить той самий векторний шлях, що й для непорожнього чанку.
+    """
+    empty_df = input_df.iloc[0:0].copy()
     result = transform_data(empty_df)
     assert result.empty
+    assert list(result.columns) == PROCESSED_COLUMNS
+    assert result["original_price"].dtype == np.float64
+    assert result["rounded_price"].dtype == np.float64
+    assert result["book_id"].dtype == input_df["book_id"].dtype
     
-def test_transform_data_structure(input_df):
-    """Перевіряємо точну відповідність структури DataFrame (schema)."""
-    result = transform_data(input_df)
-    expected_columns = ["book_id", "title", "genre", "stock_quantity", 
-                        "last_updated", "original_price", "rounded_price", "price_category"]
-    
-    # Перевіряємо, що всі колонки на місці (порядок може відрізнятись, тому set)
-    assert set(result.columns) == set(expected_columns)
+def test_transform_data_structure(processed_df):
+    """Перевіряємо точну відповідність структури DataFrame (schema): price зникла, нові колонки на місці."""
+    columns = set(processed_df.columns)
+    assert not EXPECTED_COLS - columns, f"Відсутні колонки: {sorted(EXPECTED_COLS - columns)}"
+    assert not columns - EXPECTED_COLS, f"Зайві колонки: {sorted(columns - EXPECTED_COLS)}"
+
+    # transform_data повертає рівно колонки books_processed у порядку вставки
+    assert list(processed_df.columns) == PROCESSED_COLUMNS
 
 # -------------------------------------------------------------------
 # Tests for Validation Helpers
 # -------------------------------------------------------------------
-def test_validate_cli_date_valid():
-    """Перевірка валідної дати."""
-    dt = _validate_cli_date("2025-01-01")
-    assert isinstance(dt, datetime)
-    assert dt == datetime(2025, 1, 1)
-
-def test_validate_cli_date_invalid_format():
-    """Перевірка неправильного формату."""
-    with pytest.raises(ValueError, match="Невірний формат дати"):
-        _validate_cli_date("01-01-2025")  # DD-MM-YYYY не підтримуємо
-
-def test_validate_cli_date_garbage():
-    """Перевірка сміття на вході."""
-    with pytest.raises(ValueError):
-        _validate_cli_date("not-a-date")
+@pytest.mark.parametrize(
+    "s, ok, exp",
+    [
+        ("2025-01-01", True, datetime(2025, 1, 1)),  # валідна дата
+        ("01-01-2025", False, None),  # DD-MM-YYYY не підтримуємо
+        ("not-a-date", False, None),  # сміття на вході
+    ],
+)
+def test_validate_cli_date(s, ok, exp):
+    """Перевірка валідної дати, неправильного формату та сміття на вході."""
+    if ok:
+        dt = _validate_cli_date(s)
+        assert isinstance(dt, datetime)
+        assert dt == exp
+    else:
+        with pytest.raises(ValueError, match=_RE_DATE_ERR):
+            _validate_cli_date(s)
 
 def test_required_env_missing():
     """Перевірка, що функція кидає помилку, якщо немає змінних."""
-    with pytest.raises(ValueError, match="Не вказана обов'язкова змінна"):
+    with pytest.raises(ValueError, match=_RE_ENV_ERR):
         _required_env("localhost", "", "user", "pass") # DB_NAME пустий
 
 def test_required_env_ok():
-    """Якщо все є, помилки немає."""
-    try:
-        _required_env("localhost", "db", "user", "pass")
-    except ValueError:
-        pytest.fail("_required_env raised ValueError unexpectedly!")
+    """Якщо все є, помилки немає (виняток сам завалить тест зі справжнім traceback)."""
+    _required_env("localhost", "db", "user", "pass")
+
+# -------------------------------------------------------------------
+# Tests for chunked pipeline (extract / transform / load у потоках)
+# -------------------------------------------------------------------
+def test_run_chunked_pipeline_totals(monkeypatch, engine, input_df):
+    """Конвеєр проганяє всі чанки через transform + load і рахує підсумки."""
+    chunks = [input_df.iloc[:2], input_df.iloc[2:]]
+    loaded = []
+
+    def fake_load(df, conn):
+        loaded.append(df)
+        return len(df)
+
+    monkeypatch.setattr(books_etl, "extract_books_iter", lambda engine, cutoff_dt, chunksize: (c for c in chunks))
+    monkeypatch.setattr(books_etl, "load_data", fake_load)
+
+    assert run_chunked_pipeline(engine, datetime(2025, 1, 1), chunksize=2) == (3, 3)
+    assert [len(df) for df in loaded] == [2, 1]
+    assert all("price_category" in df.columns for df in loaded)
+
+def test_run_chunked_pipeline_load_error(monkeypatch, engine, input_df):
+    """Помилка load має прокинутись назовні, а не підвісити extract на повній черзі."""
+    chunks = [input_df] * 10
+
+    def failing_load(df, conn):
+        raise RuntimeError("load failed")
+
+    monkeypatch.setattr(books_etl, "extract_books_iter", lambda engine, cutoff_dt, chunksize: (c for c in chunks))
+    monkeypatch.setattr(books_etl, "load_data", failing_load)
+
+    with pytest.raises(RuntimeError, match="load failed"):
+        run_chunked_pipeline(engine, datetime(2025, 1, 1), chunksize=3)
+
+# -------------------------------------------------------------------
+# Tests for multiprocessing (ETL_WORKERS > 1)
+# -------------------------------------------------------------------
+class _MaxConnectionsEngine:
+    """Мінімальний Engine для _cap_workers: connect() -> execute(...).scalar() повертає max_connections."""
+
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, _stmt):
+        return self
+
+    def scalar(self):
+        return str(self.max_connections)  # SHOW повертає текст
+
+
+@pytest.mark.parametrize(
+    "requested, cpu_count, max_connections, expected",
+    [
+        (4, 8, 100, 4),  # запит менший за всі ліміти
+        (16, 8, 100, 8),  # обмежує кількість CPU
+        (16, 8, 10, 5),  # обмежує половина max_connections
+        (4, None, 100, 1),  # cpu_count() невідомий -> 1
+        (4, 8, 1, 1),  # не менше одного воркера
+    ],
+)
+def test_cap_workers(monkeypatch, requested, cpu_count, max_connections, expected):
+    """ETL_WORKERS обмежується CPU та половиною max_connections сервера."""
+    monkeypatch.setattr(books_etl.os, "cpu_count", lambda: cpu_count)
+
+    assert books_etl._cap_workers(_MaxConnectionsEngine(max_connections), requested) == expected
+
+@pytest.fixture
+def thread_pool_executor(monkeypatch):
+    """ProcessPoolExecutor -> ThreadPoolExecutor: та сама логіка run_chunked_multiprocess без spawn і БД."""
+    monkeypatch.setattr(
+        books_etl,
+        "ProcessPoolExecutor",
+        lambda max_workers, mp_context, initializer: ThreadPoolExecutor(max_workers=max_workers),
+    )
+
+def test_run_chunked_multiprocess_bounded(monkeypatch, thread_pool_executor, input_df):
+    """Усі чанки обробляються, а extract не випереджає load більше ніж на workers * 2 чанків."""
+    workers = 2
+    lock = threading.Lock()
+    state = {"extracted": 0, "done": 0, "max_in_flight": 0}
+
+    def fake_extract(engine, cutoff_dt, chunksize):
+        for _ in range(20):
+            with lock:
+                state["max_in_flight"] = max(state["max_in_flight"], state["extracted"] - state["done"])
+                state["extracted"] += 1
+            yield input_df
+
+    def fake_process(chunk):
+        time.sleep(0.001)
+        with lock:
+            state["done"] += 1
+        return len(chunk)
+
+    monkeypatch.setattr(books_etl, "extract_books_iter", fake_extract)
+    monkeypatch.setattr(books_etl, "_process_chunk", fake_process)
+
+    totals = books_etl.run_chunked_multiprocess(None, datetime(2025, 1, 1), chunksize=3, workers=workers)
+
+    assert totals == (60, 60)
+    assert state["max_in_flight"] <= workers * 2
+
+def test_run_chunked_multiprocess_error(monkeypatch, thread_pool_executor, input_df):
+    """Помилка воркера прокидується назовні, а extract зупиняється (генератор закривається)."""
+    state = {"yielded": 0, "closed": False}
+
+    def fake_extract(engine, cutoff_dt, chunksize):
+        try:
+            for _ in range(100):
+                state["yielded"] += 1
+                yield input_df
+        finally:
+            state["closed"] = True
+
+    def failing_process(chunk):
+        raise RuntimeError("worker failed")
+
+    monkeypatch.setattr(books_etl, "extract_books_iter", fake_extract)
+    monkeypatch.setattr(books_etl, "_process_chunk", failing_process)
+
+    with pytest.raises(RuntimeError, match="worker failed"):
+        books_etl.run_chunked_multiprocess(None, datetime(2025, 1, 1), chunksize=3, workers=2)
+
+    assert state["closed"]
+    assert state["yielded"] < 100
+
+def test_init_worker_registers_cleanup(monkeypatch):
+    """_init_worker відкриває Connection воркера і реєструє atexit, що закриває його разом з Engine."""
+    worker_engine = create_engine("sqlite://")
+    registered = []
+
+    monkeypatch.setattr(books_etl, "setup_logging", lambda: None)
+    monkeypatch.setattr(books_etl, "connect_to_db", lambda pool_size: worker_engine)
+    monkeypatch.setattr(books_etl.atexit, "register", lambda func, *args: registered.append((func, args)))
+    monkeypatch.setattr(books_etl, "_WORKER_CONN", None)
+
+    books_etl._init_worker()
+    conn = books_etl._WORKER_CONN
+    assert conn is not None and not conn.closed
+
+    [(func, args)] = registered
+    func(*args)
+    assert conn.closed
+    assert books_etl._WORKER_CONN is None
+
+# -------------------------------------------------------------------
+# Tests for main: ETL_PROCESS_IN_PYTHON=0 (in-database режим)
+# -------------------------------------------------------------------
+@pytest.mark.parametrize("loaded, exit_code", [(5, None), (0, 0)])
+def test_main_in_database_mode(monkeypatch, caplog, loaded, exit_code):
+    """ETL_PROCESS_IN_PYTHON=0 -> лише run_in_database; 0 записів -> вихід з кодом 0."""
+    calls = []
+
+    def fake_run_in_database(engine, cutoff_dt):
+        calls.append(cutoff_dt)
+        return loaded
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("pandas-шлях не має викликатись в in-database режимі")
+
+    monkeypatch.setenv("ETL_PROCESS_IN_PYTHON", "0")
+    monkeypatch.setattr(books_etl.sys, "argv", ["books_etl.py", "2025-01-01"])
+    # Власний Engine замість session-фікстури: main робить engine.dispose() у finally.
+    monkeypatch.setattr(books_etl, "connect_to_db", lambda: create_engine("sqlite://"))
+    monkeypatch.setattr(books_etl, "run_in_database", fake_run_in_database)
+    monkeypatch.setattr(books_etl, "run_chunked_pipeline", unexpected)
+    monkeypatch.setattr(books_etl, "extract_books", unexpected)
+
+    with caplog.at_level("INFO", logger="books_etl"):
+        if exit_code is None:
+            books_etl.main()
+        else:
+            with pytest.raises(SystemExit) as exc:
+                books_etl.main()
+            assert exc.value.code == exit_code
+
+    assert calls == [datetime(2025, 1, 1)]
+    if loaded:
+        # extracted_total = loaded_total: окремого extract у цьому режимі немає
+        assert f"extracted={loaded} loaded={loaded}" in caplog.text
 
 # -------------------------------------------------------------------
 # тестування Load Data з реальною БД
 # -------------------------------------------------------------------
 
-def test_load_data_real_db_flow(input_df):
+@pytest.mark.slow
+def test_load_data_real_db_flow(clean_db, processed_df):
     """
     Тестуємо load_data за допомогою бази SQLite в пам'яті.
-    Це перевіряє логіку транзакцій, видалення та вставки.
+    Це перевіряє логіку транзакцій та upsert (оновлення існуючого book_id).
     """
-    # 1. Створюємо engine для SQLite в пам'яті
-    engine = create_engine("sqlite:///:memory:")
-    
-    # 2. Створюємо необхідну таблицю
-    with engine.begin() as conn:
-        conn.execute(text("""
-            CREATE TABLE books_processed (
-                book_id INTEGER PRIMARY KEY,
-                title TEXT,
-                original_price REAL,
-                rounded_price REAL,
-                genre TEXT,
-                price_category TEXT
-            )
-        """))
-        # Додамо "старий" запис для перевірки ідемпотентності (видалення перед записом)
-        conn.execute(text("""
-            INSERT INTO books_processed (book_id, title) VALUES (1, 'Old Title')
-        """))
-
-    # 3. Підготовка даних (3 книги, одна з яких має id=1)
-    processed_df = transform_data(input_df)
-    
-    # 4. Виконуємо load_data
-    loaded_count = load_data(processed_df, engine)
-    
-    # 5. Перевірки
+    # 1. "Старий" запис з id=1 уже додав clean_db — перевіряємо ідемпотентність (upsert замість дубліката).
+    #    Виконуємо load_data (транзакція тесту вже відкрита -> чанк пишеться в SAVEPOINT)
+    loaded_count = load_data(processed_df, clean_db)  # 3 книги, одна з яких має id=1
+
+    # 2. Перевірки
     assert loaded_count == 3
-    
-    with engine.connect() as conn:
-        # Перевіряємо загальну кількість
-        res = conn.execute(text("SELECT COUNT(*) FROM books_processed")).scalar()
-        assert res == 3
-        
-        # Перевіряємо, чи оновився запис з id=1 (чи спрацював DELETE перед INSERT)
-        title_res = conn.execute(
-            text("SELECT title FROM books_processed WHERE book_id = 1")
-        ).scalar()
-        assert title_res == "Cheap Book"  # Нова назва, а не 'Old Title'
\ No newline at end of file
+
+    # Одним читанням усю таблицю (крім processed_at) з Arrow-dtypes і порівнюємо з тим, що вантажили:
+    # 3 рядки, а запис з id=1 оновився (чи спрацював upsert) — 'Cheap Book', а не 'Old Title'.
+    actual = pd.read_sql_query(
+        f"SELECT {', '.join(PROCESSED_COLUMNS)} FROM books_processed ORDER BY book_id",
+        clean_db,
+        dtype_backend="pyarrow",
+    )
+    expected = processed_df.reset_index(drop=True).astype(
+        {col: pd.ArrowDtype(typ) for col, typ in LOADED_ARROW_TYPES.items()}
+    )
+    pd.testing.assert_frame_equal(actual, expected)
+
+@pytest.mark.slow
+def test_load_data_unsupported_dialect(monkeypatch, db_conn, processed_df):
+    """Діалект без upsert -> ValueError з назвою діалекту, а не "неочікувана помилка" після retry."""
+    monkeypatch.setattr(books_etl, "_UPSERT_PROCESSED_STMTS", {})
+
+    with pytest.raises(ValueError, match="діалекту sqlite"):
+        load_data(processed_df, db_conn)